@@ -1,13 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
+import multiprocessing
+
 import streamlit as st
-from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, astuple
+from functools import lru_cache
 from datetime import datetime
-import itertools
 from zoneinfo import ZoneInfo
 
+import kernel
+
 # -------------------- 資料結構 --------------------
+# Quad 只服務輸入表單與單象限結果顯示（每次提交各象限算一次）；
+# 最佳化掃描全程用 SoA（G4/X4/Y4 tuple 與 ndarray），不建立 Quad 物件。
 @dataclass
 class Quad:
     X: float   # 鎖點X座標 (mm)
@@ -37,18 +46,27 @@ class Quad:
 
 
 # -------------------- 工具函式 --------------------
-def frange(start: float, stop: float, step: float):
-    vals = []
-    x = start
-    while x <= stop + 1e-9:  # 容忍浮點誤差
-        vals.append(round(x, 6))
-    # 防止無限迴圈
-        x += step if step != 0 else 1e-9
-    return vals
-
-
-def assign_stars(modified_params: set) -> str:
-    """ 星星等級：修改越少，星數越高 """
+@lru_cache(maxsize=256)
+def frange(start: float, stop: float, step: float) -> np.ndarray:
+    """以整數個數產生等距候選值，回傳 ndarray 供向量化計算直接使用。
+
+    用「個數」而非逐步累加，避免浮點步進誤差；1e-9 為容忍誤差。
+    個數用 floor 而非 int() 截斷：MIN_* 夾住下限讓 stop < start 時，
+    int() 朝零捨入會多留一個超出 stop 的點，floor 才會回傳空陣列。
+    beam 各回合常重建相同的候選軸，以 (start, stop, step) 為鍵快取；
+    呼叫端只讀不寫（過濾都以布林索引產生新陣列），共用同一陣列安全。
+    """
+    if step == 0:
+        step = 1e-9
+    n = int(np.floor((stop - start) / step + 1e-9)) + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.float64)
+    return np.round(start + np.arange(n) * step, 6)
+
+
+@lru_cache(maxsize=32)
+def assign_stars(modified_params: frozenset) -> str:
+    """ 星星等級：修改越少，星數越高（以 frozenset 為鍵，最多 16 種子集） """
     if not modified_params:
         return "★"
     if modified_params == {"ST"}:
@@ -60,11 +78,562 @@ def assign_stars(modified_params: set) -> str:
         return {1: "★★★", 2: "★★", 3: "★"}.get(len(modified_params), "★")
 
 
-def is_quad4_disabled_by_dims(q: Quad) -> bool:
+@lru_cache(maxsize=16)
+def _mask_to_set(mask: int) -> frozenset:
+    """修改位元遮罩（bit3=ST, bit2=SW, bit1=SL, bit0=SS）→ 參數名稱集合。
+
+    回傳不可變的 frozenset：可直接當 assign_stars 的快取鍵，
+    16 種遮罩各只建一次物件，結果列之間共用。
+    """
+    modified = set()
+    if mask & 8: modified.add("ST")
+    if mask & 4: modified.add("SW")
+    if mask & 2: modified.add("SL")
+    if mask & 1: modified.add("SS")
+    return frozenset(modified)
+
+
+# 16 種遮罩組合的星等查表：在匯入時用 assign_stars 產一次，
+# 熱路徑以索引取代集合配置與字串比對，規則仍只定義在 assign_stars。
+STAR_TABLE = tuple(assign_stars(_mask_to_set(m)) for m in range(16))
+
+# 象限名稱：綁成模組常數，顯示端共用同一組字串物件
+Q_NAMES = ("第一", "第二", "第三", "第四")
+
+
+def is_quad4_disabled_by_dims(SL: float, SW: float, ST_v: float, SS: float) -> bool:
     """第4象限停用條件：D_SL、D_SW、D_ST、D_SS 全為 0 則不參與最佳化。"""
     eps = 1e-12
-    return (abs(q.SL) < eps and abs(q.SW) < eps and abs(q.ST) < eps and abs(q.SS) < eps)
+    return (abs(SL) < eps and abs(SW) < eps and abs(ST_v) < eps and abs(SS) < eps)
+
+
+def solve_SL_analytic(C4, X4, Y4, F_target, u_D):
+    """固定 u_D = 1/SL_D^3，直接解剩下三個象限的 u = 1/SL^3。
+
+    令 F_k = C_k * u_k，三條等式
+        ΣF = F_target、ΣF·X = 0、ΣF·Y = 0（力心正中）
+    對 (u_A, u_B, u_C) 是 3×3 線性系統；幾何退化（奇異矩陣）
+    或解出非正值（對應不存在的 SL）時回傳 None。
+    """
+    A = np.array([
+        [C4[0],         C4[1],         C4[2]],
+        [C4[0] * X4[0], C4[1] * X4[1], C4[2] * X4[2]],
+        [C4[0] * Y4[0], C4[1] * Y4[1], C4[2] * Y4[2]],
+    ])
+    b = np.array([F_target - C4[3] * u_D,
+                  -C4[3] * X4[3] * u_D,
+                  -C4[3] * Y4[3] * u_D])
+    try:
+        u = np.linalg.solve(A, b)
+    except np.linalg.LinAlgError:
+        return None
+    if not np.all(np.isfinite(u)) or np.any(u <= 0.0):
+        return None
+    return u
+
+
+
+# -------------------- NumPy 後備掃描路徑 --------------------
+# numba 未安裝時使用；全域粗掃可用行程池依 ST 軸分片平行。
+
+def prep_SL_axes(SL_ranges):
+    """SL 軸與 1/SL^3 只依 SL 範圍而定，每個階段算一次供所有 (ST,SW,SS) 共用。
+
+    停用象限（SL=0）的 1/SL^3 記為 0，合力自然為 0，不需逐點分支。
+    """
+    axes = [np.asarray(r, dtype=np.float64) for r in SL_ranges]
+    inv_cubes = [np.where(a > 0, 1.0 / (s := np.where(a > 0, a, 1.0)) / s / s, 0.0)
+                 for a in axes]
+    return axes, inv_cubes
+
+def _boundary_seed(STv, SWv, SSv, axes, F_sum_min, F_sum_max, F_target):
+    """剪枝三元組的邊界種子：取 SL 盒內總力最接近目標的盒角。
+
+    SL 軸遞增 ⇒ 總力最大在各軸索引 0（全取最小 SL）、最小在索引尾端；
+    剪枝只在粗三元組上評估，界線外的三元組仍要當 beam 起點，
+    細掃才搆得到粗格點之間的 ST/SW/SS。
+    """
+    d_hi = abs(F_sum_max - F_target)
+    d_lo = abs(F_sum_min - F_target)
+    if d_hi <= d_lo:
+        return (STv, SWv, SSv, tuple(float(a[0]) for a in axes), d_hi)
+    return (STv, SWv, SSv, tuple(float(a[-1]) for a in axes), d_lo)
+
+
+def eval_SL_grid(STv, SWv, SSv, axes, inv_cubes, G4, X4, Y4,
+                 lower_bound, upper_bound, xy_tol, F_target):
+    """固定 (ST, SW, SS)，把四個象限的 SL 候選廣播成 4 維網格一次算完。
+
+    共用項 3*SW*ST^3*SS/12 只算一次，各象限僅差 G_k 倍數；
+    |XM| <= tol*F 與 |XM/F| <= tol 等價（F 下限 > 0），可免除逐點除法。
+    回傳 (原始列list, 最接近目標力的種子 or None)；
+    列格式 (ST, SW, SS, SLs, totF, allX, allY)，星等由呼叫端補上。
+    """
+    full_axes = axes             # 原始軸：軸剪空時供邊界種子取角
+    axes = list(axes)            # 淺複製：剪枝以新陣列取代元素，
+    inv_cubes = list(inv_cubes)  # 不動到各階段共用的原始軸
+    if any(a.size == 0 for a in axes):
+        return [], None
+
+    common = 0.25 * SWv * (STv * STv * STv) * SSv  # 3/12 摺入 0.25，免 pow
+    C = [common * G4[k] for k in range(4)]
+
+    # 代數剪枝：固定 (ST,SW,SS) 後 F_k = C_k / SL_k^3 對 SL_k 單調遞減，
+    # 由總力範圍與其他象限的 F 極值可直接界定每個象限可行的 SL 候選，
+    # 先縮小各軸再廣播，避免建立注定不可行的網格。
+    F_min = [0.0] * 4
+    F_max = [0.0] * 4
+    for k in range(4):
+        pos_inv = inv_cubes[k][axes[k] > 0]
+        if pos_inv.size:
+            F_min[k] = C[k] * float(pos_inv.min())
+            F_max[k] = C[k] * float(pos_inv.max())
+    sum_F_min = sum(F_min)
+    sum_F_max = sum(F_max)
+    for k in range(4):
+        if not np.any(axes[k] > 0):
+            continue  # 停用象限（SL=0）不剪枝
+        Fk = C[k] * inv_cubes[k]
+        keep = ((Fk <= upper_bound - (sum_F_min - F_min[k]))
+                & (Fk >= lower_bound - (sum_F_max - F_max[k])))
+        axes[k] = axes[k][keep]
+        inv_cubes[k] = inv_cubes[k][keep]
+    if any(a.size == 0 for a in axes):
+        # 任一軸剪空 ⇒ 整個 SL 盒搆不到力窗，最接近目標的總力在
+        # 盒角（單調性）：仍回傳邊界種子，beam 才搆得到鄰近格點。
+        return [], _boundary_seed(STv, SWv, SSv, full_axes,
+                                  sum_F_min, sum_F_max, F_target)
+
+    # 先只算總力網格：力窗剔除絕大多數格點後，
+    # 力矩只對倖存者以 1 維 gather 計算，省掉兩個 4 維張量。
+    Fk_1d = [C[k] * inv_cubes[k] for k in range(4)]
+    # sparse=True 只回傳可廣播的視圖，不實體化 4 維張量
+    F0, F1, F2, F3 = np.meshgrid(*Fk_1d, indexing="ij", sparse=True)
+    totF = F0 + F1 + F2 + F3
+
+    results = []
+    hits = np.argwhere((totF >= lower_bound) & (totF <= upper_bound))
+    if hits.shape[0]:
+        fvals = [Fk_1d[k][hits[:, k]] for k in range(4)]
+        tF = fvals[0] + fvals[1] + fvals[2] + fvals[3]
+        XM = sum(fvals[k] * X4[k] for k in range(4))
+        YM = sum(fvals[k] * Y4[k] for k in range(4))
+        tol = xy_tol * tF
+        keep = (np.abs(XM) <= tol) & (np.abs(YM) <= tol)
+        for j in np.flatnonzero(keep):
+            SLs = tuple(float(axes[k][hits[j, k]]) for k in range(4))
+            results.append((STv, SWv, SSv, SLs, float(tF[j]),
+                            float(XM[j]) / float(tF[j]),
+                            float(YM[j]) / float(tF[j])))
+
+    diff = np.abs(totF - F_target)
+    bidx = np.unravel_index(int(np.argmin(diff)), diff.shape)
+    best_SLs = tuple(float(axes[k][bidx[k]]) for k in range(4))
+    seed = (STv, SWv, SSv, best_SLs, float(diff[bidx]))
+    return results, seed
+
+
+def prep_unit_bounds(inv_cubes, G4, X4, Y4):
+    """單位界線：common=1 時的總力／力矩上下界。
+
+    只依 SL 軸極值與幾何（G、X、Y），對 (ST,SW,SS) 全部不變——
+    一個階段算一次，三元組迴圈內乘上 common 就是實際上下界。
+    回傳 (uF_min, uF_max, uxm_lo, uxm_hi, uym_lo, uym_hi)。
+    """
+    inv_min = np.array([c.min() for c in inv_cubes])
+    inv_max = np.array([c.max() for c in inv_cubes])
+    G4 = np.asarray(G4, dtype=np.float64)
+    A_min = G4 * inv_min
+    A_max = G4 * inv_max
+    X4 = np.asarray(X4, dtype=np.float64)
+    Y4 = np.asarray(Y4, dtype=np.float64)
+    return (float(A_min.sum()), float(A_max.sum()),
+            float(np.minimum(A_min * X4, A_max * X4).sum()),
+            float(np.maximum(A_min * X4, A_max * X4).sum()),
+            float(np.minimum(A_min * Y4, A_max * Y4).sum()),
+            float(np.maximum(A_min * Y4, A_max * Y4).sum()))
+
+
+def _score_slice(args):
+    """掃描單一 ST 切片（供 multiprocessing.Pool.map 使用，參數需可 pickle）。
+
+    對每個 (SW, SS) 先用單位界線 × common 做總力／力矩剪枝，
+    通過才展開 SL 網格。回傳 (原始列list, 種子list)。
+    """
+    (STv, SW_pool, SS_pool, axes, inv_cubes, unit_bounds, G4, X4, Y4,
+     lower_bound, upper_bound, xy_tol, F_target) = args
+    uF_min, uF_max, uxm_lo, uxm_hi, uym_lo, uym_hi = unit_bounds
+    rows = []
+    seeds = []
+    ST3 = STv * STv * STv
+    for SWv in SW_pool:
+        for SSv in SS_pool:
+            common = 0.25 * SWv * ST3 * SSv
+            F_sum_min = common * uF_min
+            F_sum_max = common * uF_max
+            # 力矩區間剪枝：整個 SL 盒內 |XM|（或 |YM|）都超過
+            # tol*F_sum_max（totF 上界）時，力心必不可能達標。
+            # 剪枝前仍記邊界種子，beam 才搆得到粗格點之間的三元組。
+            tol_hi = xy_tol * F_sum_max
+            if ((F_sum_max < lower_bound) or (F_sum_min > upper_bound)
+                    or common * uxm_lo > tol_hi or common * uxm_hi < -tol_hi
+                    or common * uym_lo > tol_hi or common * uym_hi < -tol_hi):
+                seeds.append(_boundary_seed(STv, SWv, SSv, axes,
+                                            F_sum_min, F_sum_max, F_target))
+                continue
+            res, seed = eval_SL_grid(STv, SWv, SSv, axes, inv_cubes, G4, X4, Y4,
+                                     lower_bound, upper_bound, xy_tol, F_target)
+            rows.extend(res)
+            if seed is not None:
+                seeds.append(seed)
+    return rows, seeds
+
+
+
+# -------------------- 最佳化主流程 --------------------
+# 收集到足夠解就停。固定上限而不綁 N_show：只改「顯示組合數量」時
+# 快取鍵不變，掃描不用重跑（顯示端自行取前 N 組）。
+RESULT_CAP = 60
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def run_optimization(F_target, quadA_t, quadB_t, quadC_t, quadD_t, result_cap):
+    """三階段(粗→中→精) + Beam Search（含剪枝與早停）的純計算流程。
+
+    只吃可雜湊的純量與 tuple（quad 格式 (X, Y, SL, SW, ST, SS, G)），
+    st.cache_data 以參數雜湊當快取鍵：輸入沒變時（例如只動顯示相關的
+    UI）直接回傳快取結果，不重跑掃描。回傳未排序的可行結果 list。
+    """
+    quads_t = (quadA_t, quadB_t, quadC_t, quadD_t)
+
+    lower_bound = F_target * 0.95
+    upper_bound = F_target * 1.05
+
+    # ---- 基準與限制 ----
+    # SoA：四象限以並列 tuple/陣列表示，最佳化流程不建立 Quad 物件
+    base_ST = quadA_t[4]
+    base_SW = quadA_t[3]
+    base_SS = quadA_t[5]
+    SL_bases = [q[2] for q in quads_t]
+    disable_D = is_quad4_disabled_by_dims(*quadD_t[2:6])  # 第4象限停用
+
+    MIN_SW = 3.0
+    MIN_SL = 5.0
+    MIN_SS = 0.3
+
+    # ST 區間
+    ST_min, ST_max = 0.3, 0.5
+
+    # 合力中心容許範圍與早停
+    xy_tol = 0.5
+
+    # 四象限的固定座標與鋼性模數（最佳化過程中不變）
+    X4 = tuple(q[0] for q in quads_t)
+    Y4 = tuple(q[1] for q in quads_t)
+    G4 = tuple(q[6] for q in quads_t)
+    G4_arr = np.asarray(G4, dtype=np.float64)
+    X4_arr = np.asarray(X4, dtype=np.float64)
+    Y4_arr = np.asarray(Y4, dtype=np.float64)
+
+    def modified_flags(values, pool, base):
+        """以格點索引判斷各候選值是否偏離基準（取代逐筆 round 比較）。
+
+        候選軸是等距格點，值偏離基準 ⇔ 索引不等於基準索引；
+        基準不在格點上（被 MIN_* 夾住或以種子為中心）時全部視為已修改。
+        """
+        pool = np.asarray(pool, dtype=np.float64)
+        base_idx = int(np.argmin(np.abs(pool - base)))
+        if round(float(pool[base_idx]) - base, 6) != 0:
+            return np.ones(len(values), dtype=bool)
+        return np.searchsorted(pool, values) != base_idx
+
+    def pack_modified_mask(rows, ST_pool, SW_pool, SS_pool, SL_ranges):
+        """整批計算修改位元遮罩：bit3=ST, bit2=SW, bit1=SL, bit0=SS。
+
+        結果保持欄狀（(n,10) 列陣 + (n,) 遮罩），不在掃描途中建立
+        per-survivor 的 Python tuple；顯示用 tuple 留到最外層一次轉換。
+        遮罩值域僅 0..15，用 int16 存即可，省下 3/4 記憶體流量。
+        """
+        if rows.shape[0] == 0:
+            return np.empty(0, dtype=np.int16)
+        mod_SL = np.zeros(rows.shape[0], dtype=bool)
+        for k in range(3 if disable_D else 4):
+            mod_SL |= modified_flags(rows[:, 3 + k], SL_ranges[k], SL_bases[k])
+        return (modified_flags(rows[:, 0], ST_pool, base_ST) * 8
+                + modified_flags(rows[:, 1], SW_pool, base_SW) * 4
+                + mod_SL * 2
+                + modified_flags(rows[:, 2], SS_pool, base_SS) * 1).astype(np.int16)
+
+    def run_search(ST_pool, SW_pool, SS_pool, SL_ranges, cap, parallel=False):
+        """掃描 (ST,SW,SS,SL0..SL3) 全組合，優先走 Numba JIT 核心。
+
+        numba 未安裝時退回 NumPy 廣播路徑：掃描依 ST 軸切片，
+        parallel=True（全域粗掃）時以行程池把切片分給各 CPU 核心。
+        回傳 (列陣(n,10), 修改遮罩(n,), 種子list)。
+        """
+        if kernel.HAVE_NUMBA:
+            SL_axes = [np.asarray(r, dtype=np.float64) for r in SL_ranges]
+            if any(a.size == 0 for a in SL_axes):
+                return np.empty((0, 10)), np.empty(0, dtype=np.int16), np.empty((0, 8))
+            out, counts, seed_rows = kernel.search(
+                np.asarray(ST_pool, dtype=np.float64),
+                np.asarray(SW_pool, dtype=np.float64),
+                np.asarray(SS_pool, dtype=np.float64),
+                SL_axes[0], SL_axes[1], SL_axes[2], SL_axes[3],
+                G4_arr, X4_arr, Y4_arr,
+                lower_bound, upper_bound, xy_tol, F_target, cap)
+            rows = np.concatenate([out[ti, :counts[ti]] for ti in range(counts.size)]) \
+                if counts.sum() else np.empty((0, 10))
+            mask = pack_modified_mask(rows, ST_pool, SW_pool, SS_pool, SL_ranges)
+            # 種子保持欄狀 (n,8)：[ST,SW,SS,SL0..3,|F-Ft|]，不轉 Python tuple
+            seed_rows = seed_rows.reshape(-1, 8)
+            return rows, mask, seed_rows[seed_rows[:, 7] < kernel.NO_SEED]
+
+        # NumPy 後備路徑：依 ST 軸切片（切片彼此獨立，可安全平行）
+        SL_axes, inv_cubes = prep_SL_axes(SL_ranges)
+        if any(a.size == 0 for a in SL_axes):
+            return np.empty((0, 10)), np.empty(0, dtype=np.int16), np.empty((0, 8))
+        unit_bounds = prep_unit_bounds(inv_cubes, G4_arr, X4_arr, Y4_arr)
+        slice_args = [(float(STv), SW_pool, SS_pool, SL_axes, inv_cubes,
+                       unit_bounds, G4_arr, X4_arr, Y4_arr, lower_bound,
+                       upper_bound, xy_tol, F_target) for STv in ST_pool]
+        n_proc = min(os.cpu_count() or 1, len(slice_args))
+        if parallel and n_proc > 1:
+            with multiprocessing.Pool(n_proc) as pool:
+                chunks = pool.map(_score_slice, slice_args)
+        else:
+            chunks = [_score_slice(a) for a in slice_args]
+
+        seeds_flat = []
+        flat = []
+        for rows, sds in chunks:
+            for sST, sSW, sSS, sSLs, sdiff in sds:
+                seeds_flat.append((sST, sSW, sSS) + sSLs + (sdiff,))
+            for STv, SWv, SSv, SLs, tF, allX, allY in rows:
+                flat.append((STv, SWv, SSv) + SLs + (tF, allX, allY))
+        rows_arr = np.asarray(flat, dtype=np.float64).reshape(-1, 10)[:cap]
+        mask = pack_modified_mask(rows_arr, ST_pool, SW_pool, SS_pool, SL_ranges)
+        return rows_arr, mask, np.asarray(seeds_flat, dtype=np.float64).reshape(-1, 8)
+
+    def scan_stage(step_val, SS_step, SL_half_span=0.5, seeds=None, beam_local=False):
+        """
+        通用掃描：
+        - 若 seeds 為 None：全域掃描（SW/SL 以 base±0.5）。
+        - 若 beam_local=True：在 seeds 的附近建立「小區間」局部掃描。
+        回傳 (列陣(n,10), 修改遮罩(n,), 種子欄陣(m,8)=[ST,SW,SS,SL0..3,|F-Ft|])。
+        """
+        stage_rows = []
+        stage_masks = []
+        stage_seeds = []
+
+        def finish():
+            seeds_arr = np.concatenate(stage_seeds) if stage_seeds else np.empty((0, 8))
+            if not stage_rows:
+                return np.empty((0, 10)), np.empty(0, dtype=np.int16), seeds_arr
+            return (np.concatenate(stage_rows)[:result_cap],
+                    np.concatenate(stage_masks)[:result_cap], seeds_arr)
+
+        # 建立 SL 範圍（全域或局部）
+        def build_SL_ranges(center_SLs=None, half_span=SL_half_span):
+            """四象限 SL 候選軸；停用的第4象限塌縮成單點 0（零貢獻）。"""
+            SL_D_off = np.zeros(1)
+            if beam_local and center_SLs is not None:
+                return [
+                    frange(max(MIN_SL, center_SLs[0] - half_span), center_SLs[0] + half_span, step_val),
+                    frange(max(MIN_SL, center_SLs[1] - half_span), center_SLs[1] + half_span, step_val),
+                    frange(max(MIN_SL, center_SLs[2] - half_span), center_SLs[2] + half_span, step_val),
+                    SL_D_off if disable_D else frange(max(MIN_SL, center_SLs[3] - half_span), center_SLs[3] + half_span, step_val),
+                ]
+            else:
+                return [
+                    frange(max(MIN_SL, SL_bases[0] - 0.5), SL_bases[0] + 0.5, step_val),
+                    frange(max(MIN_SL, SL_bases[1] - 0.5), SL_bases[1] + 0.5, step_val),
+                    frange(max(MIN_SL, SL_bases[2] - 0.5), SL_bases[2] + 0.5, step_val),
+                    SL_D_off if disable_D else frange(max(MIN_SL, SL_bases[3] - 0.5), SL_bases[3] + 0.5, step_val),
+                ]
+
+        # ST / SW / SS 候選
+        ST_candidates = frange(ST_min, ST_max, step_val)
+        SW_candidates = frange(max(MIN_SW, base_SW - 0.5), base_SW + 0.5, step_val)
+        SS_candidates = frange(max(MIN_SS, base_SS - 0.2), base_SS + 0.2, SS_step)
+
+        # 局部掃描（Beam）：把「還缺幾列」當預算往下傳，
+        # 額度用完就不再展開剩餘種子（等同 generator+islice 的提前斷流，
+        # 但不拆散向量化/JIT 的整批掃描）。
+        if beam_local and seeds is not None and seeds.shape[0]:
+            collected = 0
+            for s in seeds:
+                remaining = result_cap - collected
+                if remaining <= 0:
+                    break
+                sST, sSW, sSS = float(s[0]), float(s[1]), float(s[2])
+                sSLs = (float(s[3]), float(s[4]), float(s[5]), float(s[6]))
+                ST_pool = frange(max(ST_min, sST - step_val), min(ST_max, sST + step_val), step_val)
+                SW_pool = frange(max(MIN_SW, sSW - step_val), sSW + step_val, step_val)
+                SS_pool = frange(max(MIN_SS, sSS - SS_step), sSS + SS_step, SS_step)
+                SL_ranges = build_SL_ranges(center_SLs=sSLs, half_span=SL_half_span)
+                rows, mask, sds = run_search(ST_pool, SW_pool, SS_pool, SL_ranges, remaining,
+                                             parallel=True)
+                stage_rows.append(rows)
+                stage_masks.append(mask)
+                stage_seeds.append(sds)
+                collected += rows.shape[0]
+            return finish()
+
+        # 全域掃描
+        SL_ranges_global = build_SL_ranges(center_SLs=None)
+        rows, mask, sds = run_search(ST_candidates, SW_candidates, SS_candidates,
+                                     SL_ranges_global, result_cap, parallel=True)
+        stage_rows.append(rows)
+        stage_masks.append(mask)
+        stage_seeds.append(sds)
+        return finish()
+
+    def analytic_seed_pass():
+        """解析解種子：不枚舉 SL，對每個粗掃 (ST,SW,SS) 直接解 SL。
+
+        固定三元組後各象限 F_k = C_k / SL_k^3 對 SL_k 單調，
+        「總力命中目標 + 力心歸零」是 u_k = 1/SL_k^3 的線性系統：
+        取幾個 SL_D 錨點（停用時 u_D = 0）各解一次，把解貼回
+        0.1 格點、夾在允許範圍內，算精確 |F-F_target| 當種子。
+        每個三元組 O(1) 個解，補強後續 beam 局部細掃的起點。
+        """
+        step_val = 0.1
+        ST_pool = frange(ST_min, ST_max, step_val)
+        SW_pool = frange(max(MIN_SW, base_SW - 0.5), base_SW + 0.5, step_val)
+        SS_pool = frange(max(MIN_SS, base_SS - 0.2), base_SS + 0.2, 0.10)
+        SL_lo = [max(MIN_SL, b - 0.5) for b in SL_bases]
+        SL_hi = [b + 0.5 for b in SL_bases]
+        if disable_D:
+            uD_anchors = (0.0,)
+        else:
+            uD_anchors = tuple(1.0 / (sl * sl * sl)
+                               for sl in (SL_lo[3], SL_bases[3], SL_hi[3]))
+
+        # 預先配置欄狀緩衝（上限 = 三元組數 × 錨點數），以計數器填入，
+        # 避免逐筆 append Python tuple
+        max_n = len(ST_pool) * len(SW_pool) * len(SS_pool) * len(uD_anchors)
+        seeds = np.empty((max_n, 8), dtype=np.float64)
+        n_seeds = 0
+        for STv in ST_pool:
+            ST3 = STv * STv * STv
+            for SWv in SW_pool:
+                for SSv in SS_pool:
+                    common = 0.25 * SWv * ST3 * SSv
+                    C4 = tuple(common * G4[k] for k in range(4))
+                    for uD in uD_anchors:
+                        u = solve_SL_analytic(C4, X4, Y4, F_target, uD)
+                        if u is None:
+                            continue
+                        SLs = []
+                        totF = 0.0
+                        for k in range(4):
+                            if disable_D and k == 3:
+                                SLs.append(0.0)
+                                continue
+                            uk = uD if k == 3 else float(u[k])
+                            SLk = uk ** (-1.0 / 3.0)
+                            # 貼回格點並夾在允許範圍
+                            SLk = SL_lo[k] + round((SLk - SL_lo[k]) / step_val) * step_val
+                            SLk = round(SLk, 6)
+                            if not (SL_lo[k] - 1e-9 <= SLk <= SL_hi[k] + 1e-9):
+                                SLs = None
+                                break
+                            SLs.append(SLk)
+                            totF += C4[k] / (SLk * SLk * SLk)
+                        if SLs is None:
+                            continue
+                        seeds[n_seeds] = (STv, SWv, SSv, SLs[0], SLs[1],
+                                          SLs[2], SLs[3], abs(totF - F_target))
+                        n_seeds += 1
+        return seeds[:n_seeds]
+
+    # ---------------- 三階段流程 ----------------
+    all_rows = []
+    all_masks = []
+
+    def to_results():
+        """欄狀結果 → 顯示用 tuple，只在回傳前做一次。"""
+        results = []
+        for rows, masks in zip(all_rows, all_masks):
+            for i in range(rows.shape[0]):
+                m = int(masks[i])
+                SLs = (float(rows[i, 3]), float(rows[i, 4]),
+                       float(rows[i, 5]), float(rows[i, 6]))
+                results.append((float(rows[i, 0]), float(rows[i, 1]), SLs,
+                                float(rows[i, 2]), float(rows[i, 7]),
+                                float(rows[i, 8]), float(rows[i, 9]),
+                                STAR_TABLE[m], _mask_to_set(m)))
+        return results
 
+    # Stage 1：粗掃（0.1）
+    rows1, masks1, seeds1 = scan_stage(step_val=0.1, SS_step=0.10, SL_half_span=0.5, seeds=None, beam_local=False)
+    all_rows.append(rows1)
+    all_masks.append(masks1)
+
+    # Beam：挑前 K 個種子（最接近目標力，不限可行解）。
+    # 粗掃對「每個」(ST,SW,SS) 都會回報種子——被界線剪掉的三元組
+    # 也記邊界種子（界線只在粗格點上評估，粗三元組全剪不代表
+    # 中間的 ST/SW/SS 也不可行，beam 要靠種子搆到那些值）；
+    # 種子全空只剩一種情況：候選軸本身是空的（如 MIN_* 夾住後倒轉），
+    # 此時直接結束即可。
+    K = 12  # 可調：越大越穩，越小越快
+    if seeds1.shape[0] == 0:
+        return to_results()
+
+    def top_k_seeds(seed_arr, k):
+        """從種子欄陣取 |F-F_target| 最小的 k 筆（去重後）。
+
+        以 np.argpartition 做部分選取（O(n)，免整列排序），只對候選窗
+        內的少量種子排序；去重鍵取 0.01 mm 整數刻度——掃描種子與
+        解析解種子來源不同，同一格點的浮點表示可能差在最後一位，
+        量化成整數才比得準。去重後不足 k 筆就加倍候選窗重試。
+        """
+        n = seed_arr.shape[0]
+        if n == 0:
+            return seed_arr
+        ticks = np.round(seed_arr[:, :7] * 100).astype(np.int64)
+        m = min(n, 4 * k)
+        while True:
+            if m >= n:
+                cand = np.argsort(seed_arr[:, 7], kind="stable")
+            else:
+                part = np.argpartition(seed_arr[:, 7], m)[:m]
+                cand = part[np.argsort(seed_arr[part, 7], kind="stable")]
+            seen = set()
+            picked = []
+            for i in cand:
+                key = ticks[i].tobytes()
+                if key in seen:
+                    continue
+                seen.add(key)
+                picked.append(i)
+                if len(picked) >= k:
+                    break
+            if len(picked) >= k or m >= n:
+                return seed_arr[picked]
+            m = min(n, m * 2)
+
+    # 解析解種子與粗掃種子合併；同一 (ST,SW,SS,SLs) 只留一筆，
+    # 避免 beam 對同一鄰域掃兩次。
+    seeds1_sorted = top_k_seeds(np.concatenate([seeds1, analytic_seed_pass()]), K)
+
+    # Stage 2：中掃（0.05）——在粗掃種子附近局部細化
+    rows2, masks2, seeds2 = scan_stage(step_val=0.05, SS_step=0.05, SL_half_span=0.25,
+                                       seeds=seeds1_sorted, beam_local=True)
+    all_rows.append(rows2)
+    all_masks.append(masks2)
+
+    # 再次挑種子，給精掃用
+    seeds2_sorted = top_k_seeds(seeds2 if seeds2.shape[0] else seeds1, K)
+
+    # Stage 3：精掃（0.02）
+    rows3, masks3, _ = scan_stage(step_val=0.02, SS_step=0.05, SL_half_span=0.15,
+                                  seeds=seeds2_sorted, beam_local=True)
+    all_rows.append(rows3)
+    all_masks.append(masks3)
+
+    return to_results()
 
 # -------------------- Streamlit App --------------------
 def main():
@@ -72,7 +641,9 @@ def main():
     st.title("⚙️ 彈片彈簧計算器")
 
     param_map = {"SL": "長度", "SW": "寬度", "ST": "厚度", "SS": "行程"}
-    star_rank = {"★★★★": 4, "★★★": 3, "★★": 2, "★": 1}
+
+    # 時間戳記每次 rerun 只算一次（台灣時間），兩個顯示點共用
+    now_str = datetime.now(ZoneInfo("Asia/Taipei")).strftime("%Y-%m-%d %H:%M:%S")
 
     # ===== 表單：輸入區 =====
     with st.form("form"):
@@ -113,27 +684,26 @@ def main():
             return Quad(X, Y, SL, SW, ST_v, SS, G)
 
         # ---- 四象限輸入 ----
-        quadA = quad_inputs("第一象限", "A", 10.0, 10.0)
-        quadB = quad_inputs("第二象限", "B", -10.0, 10.0)
-        quadC = quad_inputs("第三象限", "C", -10.0, -10.0)
-        quadD = quad_inputs("第四象限", "D", 10.0, -10.0)
+        quadA = quad_inputs(f"{Q_NAMES[0]}象限", "A", 10.0, 10.0)
+        quadB = quad_inputs(f"{Q_NAMES[1]}象限", "B", -10.0, 10.0)
+        quadC = quad_inputs(f"{Q_NAMES[2]}象限", "C", -10.0, -10.0)
+        quadD = quad_inputs(f"{Q_NAMES[3]}象限", "D", 10.0, -10.0)
 
         submitted = st.form_submit_button("🚀 開始計算 / 最佳化")
 
     # ===== 尚未提交 =====
     if not submitted:
         st.info("請在上方輸入參數後按下「開始計算 / 最佳化」。")
-        st.write("最後更新時間：", datetime.now(tz_TW).strftime("%Y-%m-%d %H:%M:%S"))
+        st.write("最後更新時間（台灣）：", now_str)
         return
 
     # ===== 計算單象限結果 =====
     st.subheader("📈 四象限計算結果")
-    quads_dict = {"第一": quadA, "第二": quadB, "第三": quadC, "第四": quadD}
+    quads_named = tuple(zip(Q_NAMES, (quadA, quadB, quadC, quadD)))
 
     total_F = total_XM = total_YM = 0.0
     cols_res = st.columns(4)
-    for idx, name in enumerate(["第一", "第二", "第三", "第四"]):
-        q = quads_dict[name]
+    for idx, (name, q) in enumerate(quads_named):
         I = round(q.inertia(), 6)
         F = round(q.force(), 6)
         XM = round(q.moment_x(F), 6)
@@ -174,212 +744,47 @@ def main():
     # ==================== 三階段(粗→中→精) + Beam Search（含剪枝與早停） ====================
     st.subheader("💻最佳化組合")
 
-    # ---- 基準與限制 ----
-    base_SW = quadA.SW
-    base_SS = quadA.SS
-    SL_bases = [quadA.SL, quadB.SL, quadC.SL, quadD.SL]
-    disable_D = is_quad4_disabled_by_dims(quadD)  # 第4象限停用
-
-    MIN_SW = 3.0
-    MIN_SL = 5.0
-    MIN_SS = 0.3
-
-    # ST 區間
-    ST_min, ST_max = 0.3, 0.5
-
-    # 目標判定與早停
-    RESULT_CAP = int(max(10, N_show * 3))  # 收集到足夠解就停
-    xy_tol = 0.5
-
-    # 便捷物件
-    quads = [quadA, quadB, quadC] + ([] if disable_D else [quadD])
-
-    def sum_F_bounds(SWv, STv, SSv, SL_ranges):
-        """用目前 SW, ST, SS 與各象限 SL 範圍估計總合力的最小與最大值（剪枝）。"""
-        total_min = 0.0
-        total_max = 0.0
-        for i, q in enumerate(quads):
-            SL_list = SL_ranges[i]
-            if not SL_list:
-                continue
-            SLmin = min(SL_list)
-            SLmax = max(SL_list)
-            # Cq = (G * SS * SW * ST^3) / 4
-            Cq = (q.G * SSv * SWv * (STv ** 3)) / 4.0
-            if SLmin <= 0 or SLmax <= 0 or Cq == 0:
-                continue
-            F_q_max = Cq / (SLmin ** 3)  # SL 越小 F 越大
-            F_q_min = Cq / (SLmax ** 3)
-            total_min += F_q_min
-            total_max += F_q_max
-        return total_min, total_max
-
-    def evaluate_combo(STv, SWv, SSv, SLs):
-        """回傳 (是否可行, 結果tuple 或 None, |F-F_target|)"""
-        opt = {
-            "第一": Quad(quadA.X, quadA.Y, SLs[0], SWv, STv, SSv, quadA.G),
-            "第二": Quad(quadB.X, quadB.Y, SLs[1], SWv, STv, SSv, quadB.G),
-            "第三": Quad(quadC.X, quadC.Y, SLs[2], SWv, STv, SSv, quadC.G),
-            "第四": (Quad(0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0) if disable_D
-                     else Quad(quadD.X, quadD.Y, SLs[3], SWv, STv, SSv, quadD.G)),
-        }
-        totF = totXM = totYM = 0.0
-        for nm in ("第一", "第二", "第三", "第四"):
-            Fi = opt[nm].force()
-            totF += Fi
-            totXM += opt[nm].moment_x(Fi)
-            totYM += opt[nm].moment_y(Fi)
-
-        if not (lower_bound <= totF <= upper_bound):
-            return False, None, abs(totF - F_target)
-        if abs(totF) < 1e-12:
-            return False, None, abs(totF - F_target)
-
-        allX = (totXM / totF)
-        allY = (totYM / totF)
-        if not (-xy_tol <= allX <= xy_tol and -xy_tol <= allY <= xy_tol):
-            return False, None, abs(totF - F_target)
-
-        # 記錄修改參數
-        modified = set()
-        if round(STv - quadA.ST, 6) != 0: modified.add("ST")
-        if round(SWv - base_SW, 6) != 0: modified.add("SW")
-        enabled_idx = [0, 1, 2] + ([] if disable_D else [3])
-        if any(round(SLs[i] - SL_bases[i], 6) != 0 for i in enabled_idx):
-            modified.add("SL")
-        if round(SSv - base_SS, 6) != 0: modified.add("SS")
-        stars = assign_stars(modified)
-
-        return True, (STv, SWv, SLs, SSv, totF, allX, allY, stars, modified), abs(totF - F_target)
-
-    def scan_stage(step_val, SS_step, SL_half_span=0.5, seeds=None, beam_local=False):
-        """
-        通用掃描：
-        - 若 seeds 為 None：全域掃描（SW/SL 以 base±0.5）。
-        - 若 beam_local=True：在 seeds 的附近建立「小區間」局部掃描。
-        回傳 (可行結果list, 種子list[ (ST,SW,SS,SLs, |F-Ft|) ])。
-        """
-        stage_results = []
-        seeds_out = []
-
-        # 建立 SL 範圍（全域或局部）
-        def build_SL_ranges(center_SLs=None, half_span=SL_half_span):
-            if beam_local and center_SLs is not None:
-                return [
-                    frange(max(MIN_SL, center_SLs[0] - half_span), center_SLs[0] + half_span, step_val),
-                    frange(max(MIN_SL, center_SLs[1] - half_span), center_SLs[1] + half_span, step_val),
-                    frange(max(MIN_SL, center_SLs[2] - half_span), center_SLs[2] + half_span, step_val),
-                    [0.0] if disable_D else frange(max(MIN_SL, center_SLs[3] - half_span), center_SLs[3] + half_span, step_val),
-                ]
-            else:
-                return [
-                    frange(max(MIN_SL, SL_bases[0] - 0.5), SL_bases[0] + 0.5, step_val),
-                    frange(max(MIN_SL, SL_bases[1] - 0.5), SL_bases[1] + 0.5, step_val),
-                    frange(max(MIN_SL, SL_bases[2] - 0.5), SL_bases[2] + 0.5, step_val),
-                    [0.0] if disable_D else frange(max(MIN_SL, SL_bases[3] - 0.5), SL_bases[3] + 0.5, step_val),
-                ]
-
-        # ST / SW / SS 候選
-        ST_candidates = frange(ST_min, ST_max, step_val)
-        SW_candidates = frange(max(MIN_SW, base_SW - 0.5), base_SW + 0.5, step_val)
-        SS_candidates = frange(max(MIN_SS, base_SS - 0.2), base_SS + 0.2, SS_step)
-
-        # 局部掃描（Beam）
-        if beam_local and seeds:
-            for (sST, sSW, sSS, sSLs, _) in seeds:
-                ST_pool = frange(max(ST_min, sST - step_val), min(ST_max, sST + step_val), step_val)
-                SW_pool = frange(max(MIN_SW, sSW - step_val), sSW + step_val, step_val)
-                SS_pool = frange(max(MIN_SS, sSS - SS_step), sSS + SS_step, SS_step)
-                SL_ranges = build_SL_ranges(center_SLs=sSLs, half_span=SL_half_span)
-
-                for STv in ST_pool:
-                    for SWv in SW_pool:
-                        for SSv in SS_pool:
-                            F_sum_min, F_sum_max = sum_F_bounds(SWv, STv, SSv, SL_ranges)
-                            if (F_sum_max < lower_bound) or (F_sum_min > upper_bound):
-                                continue
-                            for SLs in itertools.product(*SL_ranges):
-                                if disable_D and (len(SLs) == 4) and (abs(SLs[3]) > 1e-12):
-                                    continue
-                                ok, tup, diff = evaluate_combo(STv, SWv, SSv, SLs)
-                                if ok:
-                                    stage_results.append(tup)
-                                seeds_out.append((STv, SWv, SSv, SLs, diff))
-                                if len(stage_results) >= RESULT_CAP:
-                                    return stage_results, seeds_out
-            return stage_results, seeds_out
-
-        # 全域掃描
-        SL_ranges_global = build_SL_ranges(center_SLs=None)
-        for STv in ST_candidates:
-            for SWv in SW_candidates:
-                for SSv in SS_candidates:
-                    F_sum_min, F_sum_max = sum_F_bounds(SWv, STv, SSv, SL_ranges_global)
-                    if (F_sum_max < lower_bound) or (F_sum_min > upper_bound):
-                        continue
-                    for SLs in itertools.product(*SL_ranges_global):
-                        if disable_D and (len(SLs) == 4) and (abs(SLs[3]) > 1e-12):
-                            continue
-                        ok, tup, diff = evaluate_combo(STv, SWv, SSv, SLs)
-                        if ok:
-                            stage_results.append(tup)
-                        seeds_out.append((STv, SWv, SSv, SLs, diff))
-                        if len(stage_results) >= RESULT_CAP:
-                            return stage_results, seeds_out
-        return stage_results, seeds_out
-
-    # ---------------- 三階段流程 ----------------
-    all_results = []
-
-    # Stage 1：粗掃（0.1）
-    res1, seeds1 = scan_stage(step_val=0.1, SS_step=0.10, SL_half_span=0.5, seeds=None, beam_local=False)
-    all_results.extend(res1)
-
-    # Beam：挑前 K 個種子（最接近目標力）
-    K = 12  # 可調：越大越穩，越小越快
-    seeds1_sorted = sorted(seeds1, key=lambda s: s[4])[:K]
-    use_beam_mid = len(seeds1_sorted) > 0
-
-    # Stage 2：中掃（0.05）
-    if use_beam_mid:
-        res2, seeds2 = scan_stage(step_val=0.05, SS_step=0.05, SL_half_span=0.25,
-                                  seeds=seeds1_sorted, beam_local=True)
-    else:
-        res2, seeds2 = scan_stage(step_val=0.05, SS_step=0.05, SL_half_span=0.5,
-                                  seeds=None, beam_local=False)
-    all_results.extend(res2)
-
-    # 再次挑種子，給精掃用
-    seeds2_sorted = sorted(seeds2 if seeds2 else seeds1, key=lambda s: s[4])[:K]
-    use_beam_fine = len(seeds2_sorted) > 0
-
-    # Stage 3：精掃（0.02）
-    if use_beam_fine:
-        res3, _ = scan_stage(step_val=0.02, SS_step=0.05, SL_half_span=0.15,
-                             seeds=seeds2_sorted, beam_local=True)
-    else:
-        # 保底：全域精掃（成本高，只在前兩階段都空時才會用到）
-        res3, _ = scan_stage(step_val=0.02, SS_step=0.05, SL_half_span=0.5,
-                             seeds=None, beam_local=False)
-    all_results.extend(res3)
+    all_results = run_optimization(F_target,
+                                   astuple(quadA), astuple(quadB),
+                                   astuple(quadC), astuple(quadD),
+                                   RESULT_CAP)
 
     # ---------------- 顯示結果（同原版樣式） ----------------
     if not all_results:
         st.warning("❌ 找不到符合條件的最佳化組合，請調整輸入條件或範圍。")
     else:
-        all_results.sort(key=lambda x: (-star_rank.get(x[7], 1), abs(x[4] - F_target)))
+        # 排序鍵抽成兩個欄向量，np.lexsort 在 C 層做（星等多者優先，
+        # 同星等依 |F-F_target|），不逐列呼叫 Python key 函式
+        neg_stars = np.array([-len(r[7]) for r in all_results])
+        diff_col = np.array([abs(r[4] - F_target) for r in all_results])
+        order = np.lexsort((diff_col, neg_stars))
         st.success(f"✅ 找到 {len(all_results)} 組符合條件的最佳化結果，顯示前 {min(N_show, len(all_results))} 組：")
-        for idx, (STv, SWv, SLs, SSv, totF, allX, allY, stars, modified) in enumerate(all_results[:N_show], 1):
-            with st.expander(f"組合 {idx}（{stars}）", expanded=(idx == 1)):
-                for i, nm in enumerate(["第一", "第二", "第三", "第四"]):
-                    st.write(f"{nm}象限 → 長度={SLs[i]:.2f} mm / 寬度={SWv:.2f} mm / 厚度={STv:.2f} mm / 行程={SSv:.3f} mm")
-                modified_cn = [param_map[p] for p in sorted(modified)]
-                st.write(f"🔧 修改參數：{('、'.join(modified_cn)) if modified_cn else '無'}")
-                st.write(f"合力中心 X：{allX:.2f}，Y：{allY:.2f}，總合力 F：{totF:.2f} kgf")
+        # 前 N 組彙整成一個 DataFrame 一次渲染，
+        # 免去逐組 expander / st.write 的前端往返
+        table_rows = []
+        for idx, (STv, SWv, SLs, SSv, totF, allX, allY, stars, modified) in enumerate(
+                (all_results[i] for i in order[:N_show]), 1):
+            modified_cn = [param_map[p] for p in sorted(modified)]
+            table_rows.append({
+                "組合": idx,
+                "星等": stars,
+                "長度一 (mm)": round(SLs[0], 2),
+                "長度二 (mm)": round(SLs[1], 2),
+                "長度三 (mm)": round(SLs[2], 2),
+                "長度四 (mm)": round(SLs[3], 2),
+                "寬度 (mm)": round(SWv, 2),
+                "厚度 (mm)": round(STv, 2),
+                "行程 (mm)": round(SSv, 3),
+                "合力中心 X": round(allX, 2),
+                "合力中心 Y": round(allY, 2),
+                "總合力 F (kgf)": round(totF, 2),
+                "修改參數": "、".join(modified_cn) if modified_cn else "無",
+            })
+        st.dataframe(pd.DataFrame(table_rows), hide_index=True, use_container_width=True)
 
     st.markdown("---")
     # ---------- 顯示最後更新時間（台灣時間） ----------
-    st.write("最後更新時間（台灣）：", datetime.now(ZoneInfo("Asia/Taipei")).strftime("%Y-%m-%d %H:%M:%S"))
+    st.write("最後更新時間（台灣）：", now_str)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 import streamlit as st
 import math
+import numpy as np
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
@@ -8,16 +9,31 @@ G = 8000  # kgf/mm^2 （彈簧鋼性模數的預設值）
 
 # ---------- 自訂浮點範圍產生器 ----------
 def frange(start, stop, step):
-    """模擬 Python 的 range，但支援小數"""
-    while start <= stop:
-        yield round(start, 2)
-        start += step
+    """等距浮點候選值（含兩端點），支援小數。
+
+    以「個數 × 間隔」一次生成 ndarray，不逐步累加，
+    避免浮點誤差讓端點漏掉或多出一格。
+    個數用 floor 而非 int() 截斷：stop < start 時 int() 會朝零捨入
+    多留一點（start 本身已超出 stop），floor 才會正確回傳空陣列。
+    """
+    n = int(np.floor((stop - start) / step + 1e-9)) + 1
+    if n <= 0:
+        return np.empty(0)
+    return np.round(start + np.arange(n) * step, 2)
 
 # ---------- 星星得分 ----------
 def score_to_stars(score):
     """將評分 (0~4) 轉換成 ★/☆ 顯示"""
     return '★' * score + '☆' * (4 - score)
 
+# ---------- 結果欄位（顯示順序） ----------
+RESULT_KEYS = (
+    "線徑", "內徑", "外徑", "中心徑", "總圈數", "有效圈數",
+    "自由長度", "密實高度", "預壓", "節距", "Spring Room Locked",
+    "行程", "壓縮確認", "行程壓力", "模組總壓力(kgf)", "模組總壓力(lbf)",
+    "晶片負載",
+)
+
 # ---------- 主程式 ----------
 def main():
     """壓縮彈簧組合計算器主程式（Streamlit 入口）"""
@@ -60,62 +76,65 @@ def main():
         # 晶片負載允許範圍 (±10%)
         PSI_lower = CPSI * 0.9
         PSI_upper = CPSI * 1.1
-        valid_combinations = []
 
         # ---------- 計算所有組合 ----------
+        # 向量化掃描：內徑 × 自由長度一次以 2 維網格算完；
+        # 自由長度的範圍依 (線徑, 總圈數) 而變，所以外層只保留
+        # (WD, SN) 兩層迴圈（~160 組），其餘全是 ndarray 運算。
+        ID_arr = frange(SSD + 0.01, SHD - 0.01, 0.1)  # 內徑
+        collected = []
         for WD in frange(0.2, 1.0, 0.1):  # 線徑
-            ID_min = SSD + 0.01
-            ID_max = SHD - 0.01
-            for ID in frange(ID_min, ID_max, 0.1):  # 內徑
-                for SN in frange(3, 20, 1):  # 總圈數
-                    NC = SN - 2  # 有效圈數
-                    if NC <= 0:
-                        continue
-                    OD = round(ID + 2*WD, 2)  # 外徑
-                    MD = round(ID + WD, 2)    # 中徑
-                    SK = round((G * WD**4) / (8 * MD**3 * NC), 2)  # 彈簧常數
-                    SL = round((SN + 1) * WD, 2)  # 密實高度
-
-                    FL_min = SL + 0.1
-                    FL_max = SRU + SL
-                    for FL in frange(FL_min, FL_max, 0.5):  # 自由長度
-                        SP = round(FL - SRU, 2)  # 預壓
-                        if SP <= 0:
-                            continue
-                        SPP = round(FL / SN, 2)  # 節距
-                        ST = round(SP + SS, 2)   # 行程
-                        SCC = round(ST + SL, 2)  # 壓縮確認
-                        if SCC > FL:
-                            continue
-                        DF = round(ST * SK, 2)   # 行程壓力
-                        TFK = round(DF * SNN, 2) # 模組總壓力 (kgf)
-                        TFL = round(TFK * 2.2046, 2) # 模組總壓力 (lbf)
-                        PSI = round((TFK / (L * W)) * 1421.0573, 2) # 晶片負載
-
-                        # ---------- 條件檢查 ----------
-                        cond1 = PSI_lower <= PSI <= PSI_upper  # 晶片負載允許
-                        cond2 = SP > 0                         # 預壓必須 > 0
-                        cond3 = SPP < 2.5                      # 節距不宜過大
-                        cond4 = SL >= FL*0.75                  # 壓縮比例合理
-                        score = sum([cond1, cond2, cond3, cond4])
-
-                        # 紀錄不符合原因
-                        notes = []
-                        if not cond1: notes.append(f"PSI超出範圍 → {PSI} lbf/in²")
-                        if not cond2: notes.append(f"預壓不足 → {SP} mm")
-                        if not cond3: notes.append(f"節距過大 → {SPP} mm")
-                        if not cond4: notes.append(f"壓縮不足 → 自由長度：{FL} mm, 密實高度：{SL} mm")
-
-                        # 符合條件才加入清單
-                        if score >= 2:
-                            valid_combinations.append({
-                                "線徑": WD, "內徑": ID, "外徑": OD, "中心徑": MD,
-                                "總圈數": SN, "有效圈數": NC, "自由長度": FL, "密實高度": SL,
-                                "預壓": SP, "節距": SPP, "Spring Room Locked": SRU - SS,
-                                "行程": ST, "壓縮確認": SCC, "行程壓力": DF,
-                                "模組總壓力(kgf)": TFK, "模組總壓力(lbf)": TFL,
-                                "晶片負載": PSI, "評分": score, "不符合原因": notes
-                            })
+            OD_arr = ID_arr + 2*WD  # 外徑
+            MD_arr = ID_arr + WD    # 中徑
+            for SN in frange(3, 20, 1):  # 總圈數
+                NC = SN - 2  # 有效圈數
+                if NC <= 0:
+                    continue
+                SK_arr = (G * WD**4) / (8 * MD_arr**3 * NC)  # 彈簧常數
+                SL = (SN + 1) * WD  # 密實高度
+
+                FL_arr = frange(SL + 0.1, SRU + SL, 0.5)  # 自由長度
+                if FL_arr.size == 0:
+                    continue
+                SP_arr = FL_arr - SRU   # 預壓
+                SPP_arr = FL_arr / SN   # 節距
+                ST_arr = SP_arr + SS    # 行程
+                SCC_arr = ST_arr + SL   # 壓縮確認
+
+                DF = ST_arr[None, :] * SK_arr[:, None]  # 行程壓力 (nID, nFL)
+                TFK = DF * SNN                          # 模組總壓力 (kgf)
+                PSI = (TFK / (L * W)) * 1421.0573       # 晶片負載
+
+                # ---------- 條件檢查 ----------
+                cond1 = (PSI_lower <= PSI) & (PSI <= PSI_upper)  # 晶片負載允許
+                cond2 = SP_arr > 0                               # 預壓必須 > 0
+                cond3 = SPP_arr < 2.5                            # 節距不宜過大
+                cond4 = SL >= FL_arr * 0.75                      # 壓縮比例合理
+                score = (cond1.astype(np.int64)
+                         + (cond2.astype(np.int64) + cond3.astype(np.int64)
+                            + cond4.astype(np.int64))[None, :])
+
+                # 符合條件（排除 SP<=0 與 SCC>FL）才展開成明細；
+                # 每列只存「欄位值 tuple + 評分 + 備註」，
+                # 中文鍵 dict 留到顯示前 N 組才建，不給每列都配一個
+                valid = cond2[None, :] & (SCC_arr <= FL_arr)[None, :] & (score >= 2)
+                for i, j in np.argwhere(valid):
+                    # 紀錄不符合原因
+                    notes = []
+                    if not cond1[i, j]: notes.append(f"PSI超出範圍 → {PSI[i, j]:.2f} lbf/in²")
+                    if not cond3[j]: notes.append(f"節距過大 → {SPP_arr[j]:.2f} mm")
+                    if not cond4[j]: notes.append(f"壓縮不足 → 自由長度：{FL_arr[j]:.2f} mm, 密實高度：{SL:.2f} mm")
+
+                    values = (WD, ID_arr[i], OD_arr[i], MD_arr[i], SN, NC,
+                              FL_arr[j], SL, SP_arr[j], SPP_arr[j], SRU - SS,
+                              ST_arr[j], SCC_arr[j], DF[i, j],
+                              TFK[i, j], TFK[i, j] * 2.2046, PSI[i, j])
+                    collected.append((WD, float(ID_arr[i]), float(SN), float(FL_arr[j]),
+                                      int(score[i, j]), values, notes))
+
+        # 還原原本 WD→ID→SN→FL 的列舉順序，讓同分組合的顯示順序不變
+        collected.sort(key=lambda t: t[:4])
+        valid_combinations = collected
 
         # ---------- 顯示結果 ----------
         st.subheader("💻最佳化組合")
@@ -123,21 +142,21 @@ def main():
         if not valid_combinations:
             st.warning("❌ 沒有符合條件的組合，請嘗試調整參數。")
         else:
-            valid_combinations.sort(key=lambda x: -x['評分'])
+            valid_combinations.sort(key=lambda x: -x[4])
             available = len(valid_combinations)
             st.success(f"✅ 找到 {available} 組符合條件的組合。顯示前 {min(N, available)} 組：")
-            for i, combo in enumerate(valid_combinations[:N]):
-                stars_display = score_to_stars(combo['評分'])
+            for i, (_, _, _, _, score, values, notes) in enumerate(valid_combinations[:N]):
+                stars_display = score_to_stars(score)
                 with st.expander(f"第 {i+1} 組（滿足條件：{stars_display}）", expanded=True):
-                    for k, v in combo.items():
-                        if k != "不符合原因" and k != "評分":
-                            st.write(f"{k}: {v}")
-                    if combo["不符合原因"]:
+                    for k, v in zip(RESULT_KEYS, values):
+                        # 原始浮點數到顯示時才格式化
+                        st.write(f"{k}: {round(float(v), 2)}")
+                    if notes:
                         st.markdown(
                             f"<div style='background-color:#fff3cd; padding:8px; border-radius:5px;'>⚠ 不符合條件：</div>",
                             unsafe_allow_html=True
                         )
-                        for note in combo["不符合原因"]:
+                        for note in notes:
                             st.write(note)
                     else:
                         st.markdown(
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""彈片最佳化掃描的數值核心。
+
+純數值熱迴圈與 Streamlit、dataclass 無關，抽到獨立模組以便用 Numba
+JIT 編譯成機器碼；最外層 ST 軸用 prange 平行，每個 ST 索引只寫自己的
+結果切片與計數器，平行區內不共享可變狀態（免用 atomic）。
+numba 未安裝時 Shrapnel.py 會退回 NumPy 廣播路徑。
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange, types
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+    prange = range
+
+# 與 fastmath 相容的「無解」哨兵值（fastmath 下不可依賴 inf/NaN 比較）
+NO_SEED = 1e300
+
+
+def _inv_cube(SL):
+    """1/SL^3；停用象限（SL<=0）記為 0，使其合力自然為 0。"""
+    inv = np.zeros(SL.size, dtype=np.float64)
+    for i in range(SL.size):
+        s = SL[i]
+        if s > 0.0:
+            inv[i] = 1.0 / (s * s * s)
+    return inv
+
+
+def _search(ST_arr, SW_arr, SS_arr, SL0, SL1, SL2, SL3,
+            G4, X4, Y4, lower, upper, xy_tol, F_target, max_per_ST):
+    """列舉 (ST,SW,SS,SL0..SL3) 全組合，回傳可行解與各三元組的最佳種子。
+
+    out[ti, j] = [ST, SW, SS, SL0, SL1, SL2, SL3, totF, allX, allY]，
+    counts[ti] 為該 ST 切片的可行解數；
+    seeds[ti, wi, si] = [ST, SW, SS, SL0..SL3, |totF-F_target|]。
+    三元組層級被剪枝時也記「邊界種子」：取 SL 盒內總力最接近目標的
+    邊界角（全取最小或全取最大 SL），beam 才搆得到粗格點之間的
+    ST/SW/SS——界線只在粗三元組上評估，三元組全剪不代表細格點也不可行。
+    """
+    nST, nSW, nSS = ST_arr.size, SW_arr.size, SS_arr.size
+    n0, n1, n2, n3 = SL0.size, SL1.size, SL2.size, SL3.size
+
+    inv0 = _inv_cube(SL0)
+    inv1 = _inv_cube(SL1)
+    inv2 = _inv_cube(SL2)
+    inv3 = _inv_cube(SL3)
+    # 各軸 1/SL^3 極值，供三元組層級的總力界線剪枝
+    mn0, mx0 = inv0.min(), inv0.max()
+    mn1, mx1 = inv1.min(), inv1.max()
+    mn2, mx2 = inv2.min(), inv2.max()
+    mn3, mx3 = inv3.min(), inv3.max()
+
+    # 單位界線（common=1 時的總力／力矩上下界）：只依 SL 軸與幾何，
+    # 對 (ST,SW,SS) 不變，提到三元組迴圈外；迴圈內乘上 common 即得實界。
+    uF_min = G4[0] * mn0 + G4[1] * mn1 + G4[2] * mn2 + G4[3] * mn3
+    uF_max = G4[0] * mx0 + G4[1] * mx1 + G4[2] * mx2 + G4[3] * mx3
+    uxm_lo = uxm_hi = uym_lo = uym_hi = 0.0
+    for k in range(4):
+        if k == 0:
+            mn, mx = mn0, mx0
+        elif k == 1:
+            mn, mx = mn1, mx1
+        elif k == 2:
+            mn, mx = mn2, mx2
+        else:
+            mn, mx = mn3, mx3
+        ax = G4[k] * mn * X4[k]
+        bx = G4[k] * mx * X4[k]
+        uxm_lo += min(ax, bx)
+        uxm_hi += max(ax, bx)
+        ay = G4[k] * mn * Y4[k]
+        by = G4[k] * mx * Y4[k]
+        uym_lo += min(ay, by)
+        uym_hi += max(ay, by)
+
+    out = np.zeros((nST, max_per_ST, 10), dtype=np.float64)
+    counts = np.zeros(nST, dtype=np.int64)
+    seeds = np.zeros((nST, nSW, nSS, 8), dtype=np.float64)
+
+    for ti in prange(nST):
+        STv = ST_arr[ti]
+        ST3 = STv * STv * STv  # 免去 pow 呼叫；3/12 常數摺入 0.25
+        cnt = 0
+        for wi in range(nSW):
+            SWv = SW_arr[wi]
+            for si in range(nSS):
+                SSv = SS_arr[si]
+                seeds[ti, wi, si, 7] = NO_SEED
+                common = 0.25 * SWv * ST3 * SSv
+
+                # 總力與力矩區間剪枝：單位界線 × common 即為實際上下界；
+                # 整個 SL 盒內總力搆不到目標窗、或 |XM|/|YM| 必超過
+                # tol*F_sum_max（totF 的上界）時，整組三元組跳過。
+                # 跳過前仍記邊界種子：SL 軸遞增 ⇒ 總力最大在索引 0
+                # （全取最小 SL）、最小在索引尾端，取較接近目標的那角。
+                F_sum_min = common * uF_min
+                F_sum_max = common * uF_max
+                tol_hi = xy_tol * F_sum_max
+                if (F_sum_max < lower or F_sum_min > upper
+                        or common * uxm_lo > tol_hi or common * uxm_hi < -tol_hi
+                        or common * uym_lo > tol_hi or common * uym_hi < -tol_hi):
+                    d_hi = abs(F_sum_max - F_target)
+                    d_lo = abs(F_sum_min - F_target)
+                    seeds[ti, wi, si, 0] = STv
+                    seeds[ti, wi, si, 1] = SWv
+                    seeds[ti, wi, si, 2] = SSv
+                    if d_hi <= d_lo:
+                        seeds[ti, wi, si, 3] = SL0[0]
+                        seeds[ti, wi, si, 4] = SL1[0]
+                        seeds[ti, wi, si, 5] = SL2[0]
+                        seeds[ti, wi, si, 6] = SL3[0]
+                        seeds[ti, wi, si, 7] = d_hi
+                    else:
+                        seeds[ti, wi, si, 3] = SL0[n0 - 1]
+                        seeds[ti, wi, si, 4] = SL1[n1 - 1]
+                        seeds[ti, wi, si, 5] = SL2[n2 - 1]
+                        seeds[ti, wi, si, 6] = SL3[n3 - 1]
+                        seeds[ti, wi, si, 7] = d_lo
+                    continue
+
+                C0 = common * G4[0]
+                C1 = common * G4[1]
+                C2 = common * G4[2]
+                C3 = common * G4[3]
+
+                # 逐層部分和界線：SL 軸遞增 ⇒ f_k 對索引遞減，
+                # 「剩餘象限全取最大仍搆不到下界」時之後的索引只會更低，
+                # 可直接 break；「剩餘全取最小已超上界」時跳過本索引。
+                # 被剪掉的子樹整棵在窗外，其最小 |totF-F_target| 必落在
+                # 子樹邊界（單調性），更新種子後再剪，種子最優性不變。
+                R1_min = C1 * mn1 + C2 * mn2 + C3 * mn3
+                R1_max = C1 * mx1 + C2 * mx2 + C3 * mx3
+                R2_min = C2 * mn2 + C3 * mn3
+                R2_max = C2 * mx2 + C3 * mx3
+                R3_min = C3 * mn3
+                R3_max = C3 * mx3
+
+                best = NO_SEED
+                b0 = b1 = b2 = b3 = 0
+                if n3 == 1:
+                    # 三象限特化：第4象限停用時其 SL 軸只剩單點 0，
+                    # f3 是常數（0）——在三元組層分流一次，
+                    # 最內層少一整圈迴圈與其分支。
+                    f3c = C3 * inv3[0]
+                    fx3 = f3c * X4[3]
+                    fy3 = f3c * Y4[3]
+                    for i0 in range(n0):
+                        f0 = C0 * inv0[i0]
+                        if f0 + R1_max < lower:
+                            d = F_target - (f0 + R1_max)
+                            if d < best:
+                                best = d
+                                b0 = i0; b1 = 0; b2 = 0
+                            break
+                        if f0 + R1_min > upper:
+                            d = f0 + R1_min - F_target
+                            if d < best:
+                                best = d
+                                b0 = i0; b1 = n1 - 1; b2 = n2 - 1
+                            continue
+                        for i1 in range(n1):
+                            f1 = C1 * inv1[i1]
+                            s1 = f0 + f1
+                            if s1 + R2_max < lower:
+                                d = F_target - (s1 + R2_max)
+                                if d < best:
+                                    best = d
+                                    b0 = i0; b1 = i1; b2 = 0
+                                break
+                            if s1 + R2_min > upper:
+                                d = s1 + R2_min - F_target
+                                if d < best:
+                                    best = d
+                                    b0 = i0; b1 = i1; b2 = n2 - 1
+                                continue
+                            for i2 in range(n2):
+                                f2 = C2 * inv2[i2]
+                                totF = f0 + f1 + f2 + f3c
+                                d = abs(totF - F_target)
+                                if d < best:
+                                    best = d
+                                    b0, b1, b2 = i0, i1, i2
+                                if totF < lower or totF > upper:
+                                    continue
+                                tol = xy_tol * totF
+                                XM = f0 * X4[0] + f1 * X4[1] + f2 * X4[2] + fx3
+                                if abs(XM) > tol:
+                                    continue
+                                YM = f0 * Y4[0] + f1 * Y4[1] + f2 * Y4[2] + fy3
+                                if abs(YM) > tol:
+                                    continue
+                                if cnt < max_per_ST:
+                                    out[ti, cnt, 0] = STv
+                                    out[ti, cnt, 1] = SWv
+                                    out[ti, cnt, 2] = SSv
+                                    out[ti, cnt, 3] = SL0[i0]
+                                    out[ti, cnt, 4] = SL1[i1]
+                                    out[ti, cnt, 5] = SL2[i2]
+                                    out[ti, cnt, 6] = SL3[0]
+                                    out[ti, cnt, 7] = totF
+                                    out[ti, cnt, 8] = XM / totF
+                                    out[ti, cnt, 9] = YM / totF
+                                    cnt += 1
+                else:
+                    for i0 in range(n0):
+                        f0 = C0 * inv0[i0]
+                        if f0 + R1_max < lower:
+                            d = F_target - (f0 + R1_max)
+                            if d < best:
+                                best = d
+                                b0 = i0; b1 = 0; b2 = 0; b3 = 0
+                            break
+                        if f0 + R1_min > upper:
+                            d = f0 + R1_min - F_target
+                            if d < best:
+                                best = d
+                                b0 = i0; b1 = n1 - 1; b2 = n2 - 1; b3 = n3 - 1
+                            continue
+                        for i1 in range(n1):
+                            f1 = C1 * inv1[i1]
+                            s1 = f0 + f1
+                            if s1 + R2_max < lower:
+                                d = F_target - (s1 + R2_max)
+                                if d < best:
+                                    best = d
+                                    b0 = i0; b1 = i1; b2 = 0; b3 = 0
+                                break
+                            if s1 + R2_min > upper:
+                                d = s1 + R2_min - F_target
+                                if d < best:
+                                    best = d
+                                    b0 = i0; b1 = i1; b2 = n2 - 1; b3 = n3 - 1
+                                continue
+                            for i2 in range(n2):
+                                f2 = C2 * inv2[i2]
+                                f012 = f0 + f1 + f2
+                                if f012 + R3_max < lower:
+                                    d = F_target - (f012 + R3_max)
+                                    if d < best:
+                                        best = d
+                                        b0 = i0; b1 = i1; b2 = i2; b3 = 0
+                                    break
+                                if f012 + R3_min > upper:
+                                    d = f012 + R3_min - F_target
+                                    if d < best:
+                                        best = d
+                                        b0 = i0; b1 = i1; b2 = i2; b3 = n3 - 1
+                                    continue
+                                for i3 in range(n3):
+                                    f3 = C3 * inv3[i3]
+                                    totF = f012 + f3
+                                    d = abs(totF - F_target)
+                                    if d < best:
+                                        best = d
+                                        b0, b1, b2, b3 = i0, i1, i2, i3
+                                    if totF < lower or totF > upper:
+                                        continue
+                                    tol = xy_tol * totF  # 力心限制乘開，免每點除法
+                                    XM = f0 * X4[0] + f1 * X4[1] + f2 * X4[2] + f3 * X4[3]
+                                    if abs(XM) > tol:
+                                        continue
+                                    YM = f0 * Y4[0] + f1 * Y4[1] + f2 * Y4[2] + f3 * Y4[3]
+                                    if abs(YM) > tol:
+                                        continue
+                                    if cnt < max_per_ST:
+                                        out[ti, cnt, 0] = STv
+                                        out[ti, cnt, 1] = SWv
+                                        out[ti, cnt, 2] = SSv
+                                        out[ti, cnt, 3] = SL0[i0]
+                                        out[ti, cnt, 4] = SL1[i1]
+                                        out[ti, cnt, 5] = SL2[i2]
+                                        out[ti, cnt, 6] = SL3[i3]
+                                        out[ti, cnt, 7] = totF
+                                        out[ti, cnt, 8] = XM / totF
+                                        out[ti, cnt, 9] = YM / totF
+                                        cnt += 1
+
+                seeds[ti, wi, si, 0] = STv
+                seeds[ti, wi, si, 1] = SWv
+                seeds[ti, wi, si, 2] = SSv
+                seeds[ti, wi, si, 3] = SL0[b0]
+                seeds[ti, wi, si, 4] = SL1[b1]
+                seeds[ti, wi, si, 5] = SL2[b2]
+                seeds[ti, wi, si, 6] = SL3[b3]
+                seeds[ti, wi, si, 7] = best
+        counts[ti] = cnt
+
+    return out, counts, seeds
+
+
+if HAVE_NUMBA:
+    # 預先宣告簽章做「急切編譯」：匯入時就編好（或直接載入 cache=True
+    # 的磁碟快取），等同 AOT 的效果——第一次按「開始計算」不付編譯成本。
+    # numba 的 pycc AOT 已自上游移除，故用簽章 + 磁碟快取取代。
+    _f8a = types.float64[::1]
+    _inv_cube = njit([_f8a(_f8a)], cache=True)(_inv_cube)
+    _search_sig = types.Tuple((
+        types.float64[:, :, ::1], types.int64[::1], types.float64[:, :, :, ::1],
+    ))(_f8a, _f8a, _f8a, _f8a, _f8a, _f8a, _f8a, _f8a, _f8a, _f8a,
+       types.float64, types.float64, types.float64, types.float64, types.int64)
+    search = njit([_search_sig], parallel=True, fastmath=True, cache=True)(_search)
+else:
+    search = _search